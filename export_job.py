@@ -0,0 +1,174 @@
+"""Scheduled incremental export of the message sheet.
+
+Rows are read in bulk with ``Worksheet.batch_get`` starting after the last
+exported row, streamed into gzip-compressed CSV files and folded into
+per-user and per-type aggregates. The cursor (last exported row) is stored
+in the same JSON file as the aggregates so both are committed together.
+The job runs on its own background thread and only issues read requests,
+spaced out and paused while live writes are in flight, so it does not
+compete with the webhook handlers for Sheets quota.
+"""
+import csv
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = ['timestamp', 'user_id', 'user_name', 'message', 'image_link', 'thumbnail_link']
+LAST_COLUMN = 'F'
+
+
+def classify_message(message_text):
+    """Return the message type from the prefix the handlers write into the sheet"""
+    if message_text.startswith('📷'):
+        return 'image'
+    if message_text.startswith('🎤 語音轉文字'):
+        return 'audio_transcript'
+    if message_text.startswith('🎤'):
+        return 'audio'
+    return 'text'
+
+
+class SheetExporter:
+    """Incrementally exports sheet rows to compressed CSV and aggregates"""
+
+    def __init__(self, get_worksheet, export_dir, chunk_rows=500, ranges_per_request=4,
+                 read_interval=2.0, is_busy=None):
+        self.get_worksheet = get_worksheet
+        self.export_dir = export_dir
+        self.chunk_rows = chunk_rows
+        self.ranges_per_request = ranges_per_request
+        self.read_interval = read_interval
+        self.is_busy = is_busy or (lambda: False)
+        self.aggregates_path = os.path.join(export_dir, 'aggregates.json')
+        self.status = {'last_run': None, 'last_error': None, 'rows_exported': 0, 'running': False}
+        self._run_lock = threading.Lock()
+
+    def load_cursor(self):
+        """Return the last exported sheet row (row 1 is the header)"""
+        return self.load_aggregates()['last_row']
+
+    def load_aggregates(self):
+        try:
+            with open(self.aggregates_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'last_row': 1, 'users': {}, 'types': {}}
+
+    def _write_json(self, path, data):
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+
+    def _read_rows(self, worksheet, first_row):
+        """Yield (row_number, values) from first_row on, one batch_get per group of ranges"""
+        # The API drops trailing empty rows from each range, so a short range
+        # doesn't mean the end of the sheet; bound the read by the last row
+        # with a timestamp instead
+        last_data_row = len(worksheet.col_values(1))
+        start = first_row
+        while start <= last_data_row:
+            # Give way to live writes and space out read requests
+            while self.is_busy():
+                time.sleep(self.read_interval)
+
+            ranges = []
+            while len(ranges) < self.ranges_per_request and start <= last_data_row:
+                end = min(start + self.chunk_rows - 1, last_data_row)
+                ranges.append((start, end))
+                start = end + 1
+            value_ranges = worksheet.batch_get([f"A{first}:{LAST_COLUMN}{last}" for first, last in ranges])
+
+            for (range_start, _), value_range in zip(ranges, value_ranges):
+                for offset, values in enumerate(value_range):
+                    yield range_start + offset, values
+            if start <= last_data_row:
+                time.sleep(self.read_interval)
+
+    def _update_aggregates(self, aggregates, values):
+        timestamp, user_id, user_name, message_text = values[:4]
+        message_type = classify_message(message_text)
+        day = timestamp[:10]
+
+        aggregates['types'][message_type] = aggregates['types'].get(message_type, 0) + 1
+        user = aggregates['users'].setdefault(user_id, {'user_name': user_name, 'total': 0, 'types': {}, 'days': {}})
+        user['user_name'] = user_name or user['user_name']
+        user['total'] += 1
+        user['types'][message_type] = user['types'].get(message_type, 0) + 1
+        user['days'][day] = user['days'].get(day, 0) + 1
+
+    def run(self):
+        """Export all rows added since the last run; returns the number of rows exported"""
+        if not self._run_lock.acquire(blocking=False):
+            logger.info("Sheet export already running, skipping")
+            return 0
+
+        self.status['running'] = True
+        temp_path = None
+        try:
+            os.makedirs(self.export_dir, exist_ok=True)
+            aggregates = self.load_aggregates()
+            last_row = aggregates['last_row']
+            worksheet = self.get_worksheet()
+
+            filename = f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}_from_row_{last_row + 1}.csv.gz"
+            path = os.path.join(self.export_dir, filename)
+            temp_path = f"{path}.tmp"
+            exported = 0
+
+            with gzip.open(temp_path, 'wt', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['row'] + EXPORT_COLUMNS)
+                for row, values in self._read_rows(worksheet, last_row + 1):
+                    if not any(values):
+                        continue
+                    # The API drops trailing empty cells; keep the CSV rectangular
+                    values = values[:len(EXPORT_COLUMNS)] + [''] * (len(EXPORT_COLUMNS) - len(values))
+                    writer.writerow([row] + values)
+                    self._update_aggregates(aggregates, values)
+                    last_row = row
+                    exported += 1
+
+            # Only advance the cursor once the file is written; the cursor and
+            # aggregates are committed together by a single replace
+            if exported:
+                os.replace(temp_path, path)
+                aggregates['last_row'] = last_row
+                aggregates['updated_at'] = datetime.now().isoformat()
+                self._write_json(self.aggregates_path, aggregates)
+                logger.info(f"Sheet export wrote {exported} rows to {path}")
+            else:
+                os.unlink(temp_path)
+                logger.info("Sheet export found no new rows")
+            temp_path = None
+
+            self.status.update(last_run=datetime.now().isoformat(), last_error=None)
+            self.status['rows_exported'] += exported
+            return exported
+        except Exception as e:
+            logger.error(f"Sheet export failed, will resume from the saved cursor: {e}")
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+            self.status.update(last_run=datetime.now().isoformat(), last_error=str(e))
+            return 0
+        finally:
+            self.status['running'] = False
+            self._run_lock.release()
+
+    def start(self, interval_seconds):
+        """Run the export every interval_seconds on a daemon thread"""
+        def loop():
+            while True:
+                self.run()
+                time.sleep(interval_seconds)
+
+        thread = threading.Thread(target=loop, name='sheet-export', daemon=True)
+        thread.start()
+        logger.info(f"Scheduled sheet export every {interval_seconds}s into {self.export_dir}")
+        return thread
@@ -0,0 +1,157 @@
+"""CPU-bound media processing executed inside worker processes.
+
+This is the only application module the pool workers import, so it must
+stay free of import-time side effects (credentials, Flask app, API clients).
+"""
+import io
+import os
+import subprocess
+import tempfile
+
+# Magic bytes used to detect the real image format regardless of what LINE reports
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+]
+
+IMAGE_MIMETYPES = {
+    'jpeg': ('image/jpeg', 'jpg'),
+    'png': ('image/png', 'png'),
+    'gif': ('image/gif', 'gif'),
+    'webp': ('image/webp', 'webp'),
+    'bmp': ('image/bmp', 'bmp'),
+    'tiff': ('image/tiff', 'tiff'),
+}
+
+
+def sniff_image_format(image_content):
+    """Return the image format detected from magic bytes, or None if unknown"""
+    if image_content[:4] == b'RIFF' and image_content[8:12] == b'WEBP':
+        return 'webp'
+    for signature, image_format in IMAGE_SIGNATURES:
+        if image_content.startswith(signature):
+            return image_format
+    return None
+
+
+def image_mimetype(image_format):
+    """Return (mimetype, file extension) for a sniffed image format"""
+    return IMAGE_MIMETYPES.get(image_format, ('application/octet-stream', 'bin'))
+
+
+def _encode_image(image, keep_alpha, quality):
+    """Encode a Pillow image as JPEG, or as optimized PNG when it has transparency"""
+    output = io.BytesIO()
+    if keep_alpha:
+        image.save(output, format='PNG', optimize=True)
+        return output.getvalue(), 'png'
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.save(output, format='JPEG', quality=quality, optimize=True, progressive=True)
+    return output.getvalue(), 'jpeg'
+
+
+def preprocess_image(image_content, max_dimension, quality, thumbnail_size=0, max_pixels=40000000):
+    """Recompress and downsize an image, optionally producing a thumbnail.
+
+    Returns a dict with the bytes to upload, their mimetype/extension, the
+    optional thumbnail bytes and the original/processed sizes. The original
+    bytes are kept whenever recompression would not make the file smaller.
+    Images above max_pixels raise instead of being decoded.
+    """
+    from PIL import Image, ImageOps
+
+    original_format = sniff_image_format(image_content)
+    result = {
+        'original_format': original_format,
+        'original_size': len(image_content),
+        'content': image_content,
+        'format': original_format,
+        'thumbnail': None,
+    }
+
+    # Refuse huge images before decoding them so one message can't exhaust a
+    # worker's memory; Image.open only reads the header
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    image = Image.open(io.BytesIO(image_content))
+    if image.width * image.height > max_pixels:
+        raise ValueError(f"Image too large to preprocess: {image.width}x{image.height}")
+    # Formats Pillow can read but the magic bytes don't cover (e.g. TIFF)
+    if original_format is None:
+        original_format = (image.format or 'jpeg').lower()
+        result['original_format'] = result['format'] = original_format
+    # Animated images would lose their frames when recompressed
+    if getattr(image, 'is_animated', False):
+        result['processed_size'] = len(image_content)
+        return result
+
+    image = ImageOps.exif_transpose(image)
+    keep_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+    resized = False
+    if max_dimension and max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        resized = True
+
+    encoded, encoded_format = _encode_image(image, keep_alpha, quality)
+    # Always re-encode formats we can't label with a proper mimetype
+    if resized or len(encoded) < len(image_content) or result['format'] not in IMAGE_MIMETYPES:
+        result['content'] = encoded
+        result['format'] = encoded_format
+    result['processed_size'] = len(result['content'])
+
+    if thumbnail_size:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS)
+        result['thumbnail'], result['thumbnail_format'] = _encode_image(thumbnail, keep_alpha, quality)
+
+    return result
+
+
+# ffmpeg output settings per transcoding target: (file extension, codec arguments)
+AUDIO_FORMATS = {
+    'ogg_opus': ('ogg', ['-c:a', 'libopus', '-application', 'voip', '-f', 'ogg']),
+    'flac': ('flac', ['-c:a', 'flac', '-f', 'flac']),
+}
+
+
+def transcode_audio(audio_content, target_format, sample_rate, bitrate, timeout):
+    """Transcode audio to mono at the given sample rate using ffmpeg.
+
+    The input is written to a temporary file because m4a/AAC files from LINE
+    may keep their index at the end, which ffmpeg cannot read from a pipe.
+    ffmpeg is killed after timeout seconds, which callers keep below their
+    own wait on the pool so an abandoned job frees its worker.
+    """
+    extension, codec_args = AUDIO_FORMATS[target_format]
+    if target_format == 'ogg_opus':
+        codec_args = codec_args + ['-b:a', bitrate]
+
+    with tempfile.NamedTemporaryFile(suffix='.m4a', delete=False) as temp_file:
+        temp_file.write(audio_content)
+        temp_file_path = temp_file.name
+
+    try:
+        completed = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', temp_file_path,
+             '-vn', '-ac', '1', '-ar', str(sample_rate)] + codec_args + ['pipe:1'],
+            capture_output=True,
+            timeout=timeout,
+        )
+    finally:
+        os.unlink(temp_file_path)
+
+    if completed.returncode != 0 or not completed.stdout:
+        raise RuntimeError(f"ffmpeg failed ({completed.returncode}): {completed.stderr.decode(errors='replace')[:200]}")
+
+    return {
+        'content': completed.stdout,
+        'format': target_format,
+        'extension': extension,
+        'sample_rate': sample_rate,
+        'original_size': len(audio_content),
+        'processed_size': len(completed.stdout),
+    }
@@ -0,0 +1,125 @@
+"""Lightweight per-event tracing for the webhook handlers.
+
+Each LINE event handled by a traced handler records the duration of its
+stages (spans). Finished traces are kept in a ring buffer so the slowest
+recent events can be inspected, and slow or sampled events are logged as
+a single structured JSON line.
+"""
+import json
+import logging
+import random
+import threading
+import time
+import functools
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class EventTrace:
+    """Timing information for a single LINE event"""
+
+    def __init__(self, event_type, event_id):
+        self.event_type = event_type
+        self.event_id = event_id
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.duration_ms = None
+        self.error = None
+
+    def to_dict(self):
+        return {
+            'event_type': self.event_type,
+            'event_id': self.event_id,
+            'started_at': self.started_at,
+            'duration_ms': self.duration_ms,
+            'error': self.error,
+            'spans': [{'name': name, 'duration_ms': duration_ms} for name, duration_ms in self.spans],
+        }
+
+
+class Tracer:
+    """Records event traces into a ring buffer and logs slow or sampled events"""
+
+    def __init__(self, buffer_size=200, slow_threshold_ms=3000, sample_rate=0.0):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.sample_rate = sample_rate
+        self._events = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def current(self):
+        """Return the trace of the event handled by this thread, if any"""
+        return getattr(self._local, 'trace', None)
+
+    def record_error(self, error):
+        """Mark the current event as failed, for handlers that catch their own errors"""
+        trace = self.current()
+        if trace is not None:
+            trace.error = type(error).__name__
+
+    def trace_event(self, event_type):
+        """Decorator tracing a LINE event handler.
+
+        The wrapper only accepts the event: WebhookHandler inspects the
+        handler's arguments and would otherwise also pass the destination.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(event):
+                message = getattr(event, 'message', None)
+                trace = EventTrace(event_type, getattr(message, 'id', None))
+                self._local.trace = trace
+                try:
+                    return func(event)
+                except Exception as e:
+                    self.record_error(e)
+                    raise
+                finally:
+                    self._local.trace = None
+                    self._finish(trace)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def span(self, name):
+        """Time a stage of the current event; a no-op outside traced handlers"""
+        trace = self.current()
+        if trace is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            trace.spans.append((name, round((time.perf_counter() - start) * 1000, 1)))
+
+    def traced(self, name):
+        """Decorator timing every call of a function as a span of the current event"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def slowest(self, limit=10):
+        """Return the slowest events currently in the ring buffer"""
+        with self._lock:
+            events = list(self._events)
+        events.sort(key=lambda trace: trace.duration_ms, reverse=True)
+        return [trace.to_dict() for trace in events[:limit]]
+
+    def _finish(self, trace):
+        trace.duration_ms = round((time.perf_counter() - trace.start) * 1000, 1)
+        with self._lock:
+            self._events.append(trace)
+
+        slow = trace.duration_ms >= self.slow_threshold_ms
+        if slow and logger.isEnabledFor(logging.WARNING):
+            logger.warning("Slow event: %s", json.dumps(trace.to_dict()))
+        elif self.sample_rate and random.random() < self.sample_rate and logger.isEnabledFor(logging.INFO):
+            logger.info("Event trace: %s", json.dumps(trace.to_dict()))